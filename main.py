@@ -4,11 +4,35 @@ import cv2
 import numpy as np
 from PIL import Image, ImageTk
 import threading
+import queue
+import bisect
 import subprocess as sp
 import json
+import hashlib
+import shutil
 import time
 import sys
 import os
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+try:
+    from numba import njit, prange
+except ImportError:  # Numba is optional; the OpenCV paths are used without it
+    njit = None
+
+# Forward seeks shorter than this many frames drain the running decoder's pipe
+# instead of respawning ffmpeg, which costs a container parse and codec init.
+DRAIN_THRESHOLD = 30
+# Kernel buffer size for the raw frame pipes
+PIPE_BUFFER_SIZE = 1 << 20
+# The shared decoder's filter graph scales and stacks both videos on every core
+FILTER_THREADS = os.cpu_count() or 1
+# Rec. 601 luma weights for RGB, broadcast to all three output channels
+LUMA_MATRIX = np.array([[0.299, 0.587, 0.114]] * 3, dtype=np.float32)
+# Filename label style: text baseline sits at LABEL_Y, 10px in from the frame edge
+LABEL_FONT, LABEL_SCALE, LABEL_THICKNESS, LABEL_Y = cv2.FONT_HERSHEY_SIMPLEX, 0.7, 1, 30
 
 def get_executable_path(name):
     """
@@ -22,6 +46,11 @@ def get_executable_path(name):
         # The application is running in a normal Python environment
         return name # Assumes ffmpeg/ffprobe are in PATH for development
 
+def get_cache_dir():
+    """Returns the per-user directory where ffprobe results are cached."""
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'VideoCompare', 'probe_cache')
+
 def parse_frame_rate(rate_str):
     """Safely parse a frame rate string (e.g., '30/1' or '29.97') into a float."""
     try:
@@ -33,6 +62,77 @@ def parse_frame_rate(rate_str):
     except (ValueError, TypeError):
         return 30.0
 
+def read_exact(stream, view):
+    """Fills `view` from `stream` in place; returns the byte count, which is only short at EOF."""
+    offset, size = 0, len(view)
+    while offset < size:
+        n = stream.readinto(view[offset:])
+        if not n: break
+        offset += n
+    return offset
+
+def enlarge_pipe(stream):
+    """Raises the kernel pipe capacity (Linux only) so each frame takes fewer read syscalls."""
+    if fcntl is None or not hasattr(fcntl, 'F_SETPIPE_SZ'): return
+    try:
+        fcntl.fcntl(stream.fileno(), fcntl.F_SETPIPE_SZ, PIPE_BUFFER_SIZE)
+    except OSError:
+        pass  # Capped by /proc/sys/fs/pipe-max-size; the default size still works
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True)
+    def diff_gray_rgb(a, b, out):
+        """Writes the luma of |a - b| to all three channels of `out` in a single pass."""
+        for i in prange(a.shape[0]):
+            for j in range(a.shape[1]):
+                d0 = abs(np.int32(a[i, j, 0]) - np.int32(b[i, j, 0]))
+                d1 = abs(np.int32(a[i, j, 1]) - np.int32(b[i, j, 1]))
+                d2 = abs(np.int32(a[i, j, 2]) - np.int32(b[i, j, 2]))
+                g = (d0 * 77 + d1 * 150 + d2 * 29) >> 8
+                out[i, j, 0] = g
+                out[i, j, 1] = g
+                out[i, j, 2] = g
+
+    @njit(parallel=True, fastmath=True)
+    def blend_rgb(a, b, out, alpha256):
+        """Fixed-point `a * (1 - alpha) + b * alpha`, with alpha given in 1/256ths."""
+        inv_alpha = 256 - alpha256
+        for i in prange(a.shape[0]):
+            for j in range(a.shape[1]):
+                for c in range(3):
+                    out[i, j, c] = (np.int32(a[i, j, c]) * inv_alpha + np.int32(b[i, j, c]) * alpha256 + 128) >> 8
+
+    @njit(parallel=True, fastmath=True, boundscheck=False)
+    def side_by_side_rgb(a, b, out, split):
+        """Writes `a` left of `split` and `b` from it onwards, with a 2px green line, in one pass."""
+        width = a.shape[1]
+        line_end = min(split + 2, width)
+        for i in prange(a.shape[0]):
+            for j in range(split):
+                for c in range(3):
+                    out[i, j, c] = a[i, j, c]
+            for j in range(split, line_end):
+                out[i, j, 0] = 0
+                out[i, j, 1] = 255
+                out[i, j, 2] = 0
+            for j in range(line_end, width):
+                for c in range(3):
+                    out[i, j, c] = b[i, j, c]
+else:
+    diff_gray_rgb = blend_rgb = side_by_side_rgb = None
+
+def warm_up_kernels():
+    """Compiles the optional Numba kernels up front so the first rendered frame doesn't pay for it."""
+    if diff_gray_rgb is None: return
+    # Same layouts as the real call: the inputs are column halves of one stacked decode buffer
+    # (non-contiguous), the output a C-contiguous composite; Numba compiles per layout
+    stacked = np.zeros((2, 4, 3), np.uint8)
+    a, b = stacked[:, :2], stacked[:, 2:]
+    out = np.zeros((2, 2, 3), np.uint8)
+    diff_gray_rgb(a, b, out)
+    blend_rgb(a, b, out, 128)
+    side_by_side_rgb(a, b, out, 1)
+
 def format_time(seconds):
     """Formats seconds into MM:SS string."""
     if seconds is None or seconds < 0: return "00:00"
@@ -57,21 +157,59 @@ class VideoComparer(tk.Tk):
         self.video_path1, self.video_path2 = None, None
         self.video_info1, self.video_info2 = {}, {}
         self.video_name1, self.video_name2 = "", ""
-        self.ffmpeg_process1, self.ffmpeg_process2 = None, None
+        self._label_sprites = (None, None)
+        self._label2_x = 0  # Right-aligned anchor for video 2's label, updated on load and resize
+        # One ffmpeg process decodes both videos and writes them side by side into each frame
+        self.ffmpeg_process = None
+        # (width, height) the running decoder scales to; its frames only fit buffers of that size
+        self._decoder_size = None
+        # NVDEC decode + scale_cuda resize; available if ffmpeg lists CUDA at startup. Each loaded
+        # pair starts on the GPU path and drops to the CPU if its first frame can't be decoded there.
+        self.hwaccel_available = False
+        self.use_hwaccel, self._hwaccel_verified = False, False
+        # Index of the next frame of each video the decoder pipe will yield
+        self.decoder_pos1, self.decoder_pos2 = 0, 0
+        self.decoder_lock = threading.Lock()
+        self._drain_buf = bytearray()
+        # Three preallocated frame pairs: the front pair (newest decode), the pair the render
+        # worker is compositing, and a spare the decoder fills next. Each pair is the left and
+        # right half of one decoded (H, 2W, 3) frame. Guarded by buffer_lock.
+        self.buffer_lock = threading.Lock()
+        self._frame_buffers = []
+        self._frame1, self._frame2 = None, None
+        self._frame_key = None
+        self._composing = None
+        # Rotating composite outputs; three so the one Tk is still copying is never overwritten
+        self._composites, self._composite_index = [], 0
+        # Single Tk image the rendered frames are pasted into; recreated only on resize
+        self._photo = None
+        # Render requests for the worker, and finished images waiting for the Tk thread
+        self.frame_q = queue.Queue(maxsize=1)
+        self.render_q = queue.Queue(maxsize=1)
+        self._playback_token = None
+        # Set whenever the decoder is repositioned, so playback restarts its frame schedule
+        # instead of counting the seek or respawn as lateness. Guarded by decoder_lock.
+        self._pacing_reset = False
+        self._seek_bar_busy = False
         self.is_playing = False
         self.current_frame_num, self.total_frames = 0, 0
         
         self.fps1, self.fps2 = 30.0, 30.0
+        # Sorted keyframe times in seconds from the container start, taken from the load-time probe
+        self.keyframes1, self.keyframes2 = [], []
+        self._probe_cache = {}
         self.video_fps = 30.0
         self.video2_offset = 0
 
         self.playback_lock = threading.Lock()
         self.display_width, self.display_height = 1200, 675
         self.split_pos = self.display_width // 2
+        self.comparison_mode = "side_by_side"
         
         self.duration_known = True
         self.is_fullscreen = False
         self._resize_job = None
+        self._drag_job = None
 
         self._setup_styles()
         self._create_widgets()
@@ -79,12 +217,15 @@ class VideoComparer(tk.Tk):
 
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
         self.after(100, self.check_ffmpeg_installed)
+        threading.Thread(target=self._render_worker, daemon=True).start()
 
     def check_ffmpeg_installed(self):
         """Checks if ffmpeg and ffprobe are accessible."""
         try:
-            sp.run([self.ffmpeg_path, '-version'], check=True, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
-            sp.run([self.ffprobe_path, '-version'], check=True, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+            hwaccels = sp.run([self.ffmpeg_path, '-hide_banner', '-hwaccels'], check=True, capture_output=True, text=True).stdout
+            # ffprobe is only run when a video is loaded, so finding it is enough here
+            if not shutil.which(self.ffprobe_path): raise FileNotFoundError(self.ffprobe_path)
+            self.hwaccel_available = 'cuda' in hwaccels.split()
         except (FileNotFoundError, sp.CalledProcessError):
             messagebox.showerror("FFmpeg Not Found", "FFmpeg could not be found.\nPlease ensure 'ffmpeg.exe' and 'ffprobe.exe' are in the same folder as the application, or that FFmpeg is in your system's PATH.")
             self.destroy()
@@ -193,16 +334,14 @@ class VideoComparer(tk.Tk):
             self.update_status_bar("File selection cancelled.")
             return
 
-        self.update_status_bar(f"Analyzing video: {file_path.split('/')[-1]}...")
-        filename = file_path.split('/')[-1]
+        filename = os.path.basename(file_path)
+        self.update_status_bar(f"Analyzing video: {filename}...")
 
         try:
-            info_command = [self.ffprobe_path, '-v', 'quiet', '-print_format', 'json', '-show_streams', file_path]
-            result = sp.run(info_command, capture_output=True, text=True, check=True)
-            all_streams = json.loads(result.stdout)['streams']
-            
-            video_stream = next((s for s in all_streams if s.get('codec_type') == 'video'), None)
-            
+            key = self._probe_key(file_path)
+            probe = self._probe(key, file_path)
+            video_stream = probe['stream']
+
             if video_stream is None:
                 messagebox.showerror("Stream Error", f"No video stream found in:\n{file_path}")
                 return
@@ -212,20 +351,87 @@ class VideoComparer(tk.Tk):
                  return
             video_stream['nb_read_frames'] = '0'
 
-        except (sp.CalledProcessError, FileNotFoundError, json.JSONDecodeError, IndexError) as e:
+        except (sp.CalledProcessError, OSError, json.JSONDecodeError, IndexError, ValueError) as e:
             messagebox.showerror("FFprobe Error", f"Could not get video info from:\n{file_path}\n\nError: {e}")
             return
 
         if video_num == 1:
             self.video_path1, self.video_info1, self.video_name1 = file_path, video_stream, filename
+            self.keyframes1 = probe['keyframes'] or []
             self.update_status_bar("Video 1 loaded. Please load Video 2.")
         else:
             self.video_path2, self.video_info2, self.video_name2 = file_path, video_stream, filename
+            self.keyframes2 = probe['keyframes'] or []
             self.update_status_bar("Video 2 loaded. Ready to play.")
+        if probe['keyframes'] is None:
+            # Listing keyframes reads every packet of the file, so it runs in the background;
+            # seeks stay single-stage until it finishes
+            threading.Thread(target=self._probe_keyframes, args=(key, file_path, video_num), daemon=True).start()
 
         if self.video_path1 and self.video_path2:
             self.initialize_playback()
 
+    def _probe_key(self, file_path):
+        """Returns the probe cache key for a file: its path, mtime and size."""
+        stat = os.stat(file_path)
+        return f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}"
+
+    def _probe_cache_file(self, key):
+        """Returns the on-disk cache path for a probe key."""
+        return os.path.join(get_cache_dir(), hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def _probe(self, key, file_path):
+        """
+        Returns {'stream': video stream info, 'keyframes': keyframe times or None}. Only the
+        headers are read here; keyframes are None until `_probe_keyframes` has listed them.
+        Complete results are cached in memory and on disk.
+        """
+        if key in self._probe_cache: return self._probe_cache[key]
+        try:
+            with open(self._probe_cache_file(key), encoding='utf-8') as f:
+                cached = json.load(f)
+            probe = {'stream': cached['stream'], 'keyframes': cached['keyframes']}
+        except (OSError, ValueError, KeyError):
+            info_command = [self.ffprobe_path, '-v', 'quiet', '-print_format', 'json', '-select_streams', 'v:0',
+                            '-show_streams', '-show_format', file_path]
+            result = json.loads(sp.run(info_command, capture_output=True, text=True, check=True).stdout)
+            video_stream = next((s for s in result.get('streams', []) if s.get('codec_type') == 'video'), None)
+            container = result.get('format', {})
+            # Matroska and some other containers only carry the duration at format level
+            if video_stream is not None and 'duration' not in video_stream and 'duration' in container:
+                video_stream['duration'] = container['duration']
+            probe = {'stream': video_stream, 'keyframes': None}
+        self._probe_cache[key] = probe
+        return probe
+
+    def _probe_keyframes(self, key, file_path, video_num):
+        """Background task: lists the video's keyframe times, caches them and hands them to the decoder."""
+        command = [self.ffprobe_path, '-v', 'quiet', '-print_format', 'json', '-select_streams', 'v:0',
+                   '-show_entries', 'packet=pts_time,flags:format=start_time', file_path]
+        try:
+            result = json.loads(sp.run(command, capture_output=True, text=True, check=True).stdout)
+            # `-ss` offsets are relative to the container start, so keyframe times are too
+            start_time = float(result.get('format', {}).get('start_time', 0))
+            keyframes = sorted(float(p['pts_time']) - start_time for p in result.get('packets', [])
+                               if 'K' in p.get('flags', '') and p.get('pts_time', 'N/A') != 'N/A')
+        except (sp.CalledProcessError, OSError, ValueError) as e:
+            print(f"Could not list keyframes for {file_path}: {e}")
+            return
+
+        probe = self._probe_cache[key]
+        probe['keyframes'] = keyframes
+        try:
+            cache_file = self._probe_cache_file(key)
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                json.dump(probe, f)
+        except OSError as e:
+            print(f"Could not write probe cache: {e}")
+
+        with self.decoder_lock:
+            if video_num == 1 and self.video_path1 == file_path: self.keyframes1 = keyframes
+            elif video_num == 2 and self.video_path2 == file_path: self.keyframes2 = keyframes
+
     def initialize_playback(self):
         """Sets up video properties once both videos are loaded."""
         try:
@@ -236,7 +442,13 @@ class VideoComparer(tk.Tk):
             fc1 = int(self.fps1 * float(self.video_info1.get('duration', 0)))
             fc2 = int(self.fps2 * float(self.video_info2.get('duration', 0)))
             self.total_frames = min(fc1, fc2) if fc1 > 0 and fc2 > 0 else 0
-            
+            self._label_sprites = (self._render_label(self.video_name1), self._render_label(self.video_name2))
+
+            with self.decoder_lock:
+                self.stop_ffmpeg_processes()
+                with self.buffer_lock: self._frame_key = None
+                # A new pair may need the CPU fallback even if the previous one decoded fine on the GPU
+                self.use_hwaccel, self._hwaccel_verified = self.hwaccel_available, False
             self.handle_resize()
 
         except Exception as e:
@@ -252,7 +464,7 @@ class VideoComparer(tk.Tk):
             self.seek_bar.config(to=self.total_frames - 1, state=tk.NORMAL)
 
         self.current_frame_num = 0
-        if self.duration_known: self.seek_bar.set(0)
+        if self.duration_known: self._set_seek_bar(0)
         self.play_pause_btn.config(state=tk.NORMAL)
         self.prev_frame_btn.config(state=tk.NORMAL)
         self.next_frame_btn.config(state=tk.NORMAL)
@@ -266,32 +478,146 @@ class VideoComparer(tk.Tk):
         ar = w / h
         return (int(th * ar), th) if tw / th > ar else (tw, int(tw / ar))
 
-    def start_ffmpeg_processes(self, frame_number):
-        self.stop_ffmpeg_processes()
-        time_offset1 = frame_number / self.fps1
-        time_offset2 = (frame_number + self.video2_offset) / self.fps2
-
-        vf_filter = f"scale={self.display_width}:{self.display_height}"
-        common_args = ['-vf', vf_filter, '-f', 'image2pipe', '-vcodec', 'rawvideo', '-pix_fmt', 'bgr24', '-']
-        
-        command1 = [self.ffmpeg_path, '-ss', str(time_offset1), '-i', self.video_path1, *common_args]
-        command2 = [self.ffmpeg_path, '-ss', str(time_offset2), '-i', self.video_path2, *common_args]
+    def _input_args(self, video_path, fps, keyframes, frame_number):
+        """Returns the input options for one video seeked to `frame_number`, and any trim left for its filter chain."""
+        time_offset = frame_number / fps
+        # Two-stage seek: jump the demuxer straight to the keyframe at or before the target,
+        # then decode forward only the rest of that GOP
+        i = bisect.bisect_right(keyframes, time_offset)
+        if i:
+            keyframe_time = keyframes[i - 1]
+            seek_args, trim = ['-ss', f"{keyframe_time:.6f}"], f"trim=start={time_offset - keyframe_time:.6f},"
+        else:
+            seek_args, trim = ['-ss', str(time_offset)], ""
+        hwaccel_args = ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda'] if self.use_hwaccel else []
+        # Frame and slice threading for the decoder
+        thread_args = ['-threads', '0', '-thread_type', 'frame+slice']
+        return [*hwaccel_args, *thread_args, *seek_args, '-i', video_path], trim
+
+    def _spawn_decoder(self, frame_number1, frame_number2):
+        """Starts an ffmpeg process that streams both videos, stacked left and right, from the given frames onwards."""
+        input1, trim1 = self._input_args(self.video_path1, self.fps1, self.keyframes1, frame_number1)
+        input2, trim2 = self._input_args(self.video_path2, self.fps2, self.keyframes2, frame_number2)
+        if self.use_hwaccel:
+            # Decode and resize on the GPU; only the scaled frames are downloaded
+            # scale_cuda converts to nv12 as well, so 10-bit (p010) sources can be downloaded too
+            scale = f"scale_cuda={self.display_width}:{self.display_height}:format=nv12,hwdownload,format=nv12"
+        else:
+            scale = f"scale={self.display_width}:{self.display_height},format=rgb24"
+        # Renumbering each input's frames 0, 1, 2... makes hstack pair them by index rather
+        # than by timestamp, as two separate decoders did, even when the frame rates differ
+        filter_graph = (f"[0:v:0]{trim1}{scale},settb=1,setpts=N[a];"
+                        f"[1:v:0]{trim2}{scale},settb=1,setpts=N[b];"
+                        f"[a][b]hstack=inputs=2:shortest=1")
+        command = [self.ffmpeg_path, '-filter_complex_threads', str(FILTER_THREADS), *input1, *input2,
+                   '-filter_complex', filter_graph, '-vsync', 'passthrough',
+                   '-f', 'image2pipe', '-vcodec', 'rawvideo', '-pix_fmt', 'rgb24', '-']
+        creation_flags = sp.CREATE_NO_WINDOW if hasattr(sp, 'CREATE_NO_WINDOW') else 0
+        # Unbuffered: frames are read straight into the frame buffers, never through a Python-side copy
+        proc = sp.Popen(command, stdout=sp.PIPE, stderr=sp.DEVNULL, bufsize=0, creationflags=creation_flags)
+        enlarge_pipe(proc.stdout)
+        return proc
+
+    def _allocate_frame_buffers(self):
+        """(Re)allocates the decode and composite buffers for the current display size."""
+        shape = (self.display_height, self.display_width, 3)
+        if self._composites and self._composites[0].shape == shape: return
+        with self.decoder_lock, self.buffer_lock:
+            self._frame_buffers = []
+            for _ in range(3):
+                stacked = np.empty((self.display_height, 2 * self.display_width, 3), np.uint8)
+                self._frame_buffers.append((stacked, stacked[:, :self.display_width], stacked[:, self.display_width:]))
+            self._frame1, self._frame2 = self._frame_buffers[0][1:]
+            self._frame_key = None
+            self._composites = [np.empty(shape, np.uint8) for _ in range(3)]
+        self._photo = ImageTk.PhotoImage(image=Image.new('RGB', (self.display_width, self.display_height)))
+        self.video_label.config(image=self._photo)
+
+    def _back_buffers(self):
+        """
+        Returns (stacked frame, left half, right half) for a pair that is neither the front
+        pair nor being composited. Caller must hold `buffer_lock`.
+        """
+        return next(bufs for bufs in self._frame_buffers if bufs[1] is not self._frame1 and bufs[1] is not self._composing)
+
+    def _decode_next_pair(self):
+        """
+        Reads the next frame of both videos into a spare pair and promotes it to the
+        front pair. Returns False on a short read. Caller must hold `decoder_lock`.
+        """
+        with self.buffer_lock: stacked, frame1, frame2 = self._back_buffers()
+        if not self._read_frame(self.ffmpeg_process, stacked):
+            if not self.use_hwaccel or self._hwaccel_verified: return False
+            # The GPU path never produced a frame (no device, unsupported codec or pixel format),
+            # so rebuild the decoder on the CPU path and retry once
+            print("Hardware decoding unavailable, falling back to CPU scaling")
+            self.use_hwaccel = False
+            self.stop_ffmpeg_processes()
+            self._seek_decoders(self.decoder_pos1)
+            if not self._read_frame(self.ffmpeg_process, stacked): return False
+        self._hwaccel_verified = True
+        with self.buffer_lock:
+            self._frame_key = (self.decoder_pos1, self.decoder_pos2, self.display_width, self.display_height)
+            self._frame1, self._frame2 = frame1, frame2
+        self.decoder_pos1 += 1
+        self.decoder_pos2 += 1
+        return True
+
+    def _read_frame(self, proc, stacked):
+        """Decodes the next stacked frame straight into the given array."""
+        return proc is not None and read_exact(proc.stdout, stacked.data.cast('B')) == stacked.nbytes
+
+    def _discard_frames(self, stream, count):
+        """Reads and drops `count` stacked frames from the decoder pipe. Returns False on EOF."""
+        frame_size = 2 * self.display_width * self.display_height * 3
+        if len(self._drain_buf) != frame_size: self._drain_buf = bytearray(frame_size)
+        view = memoryview(self._drain_buf)
+        for _ in range(count):
+            if read_exact(stream, view) != frame_size: return False
+        return True
+
+    def _seek_decoders(self, frame_number):
+        """Positions the decoder at `frame_number`, reusing it for short forward jumps. Caller must hold `decoder_lock`."""
+        target1 = max(0, frame_number)
+        target2 = max(0, frame_number + self.video2_offset)
+        proc, skip = self.ffmpeg_process, target1 - self.decoder_pos1
+        # Both videos advance together, so the pipe can only be drained if the gap between them is unchanged.
+        # After a resize the buffers are reallocated before the decoder is restarted, so check its size too.
+        reusable = (proc and proc.poll() is None and 0 <= skip < DRAIN_THRESHOLD
+                    and target2 - target1 == self.decoder_pos2 - self.decoder_pos1
+                    and self._decoder_size == (self.display_width, self.display_height))
+        if not reusable or not self._discard_frames(proc.stdout, skip):
+            self._kill_process(proc)
+            self.ffmpeg_process = self._spawn_decoder(target1, target2)
+            self._decoder_size = (self.display_width, self.display_height)
+        self.decoder_pos1, self.decoder_pos2 = target1, target2
+        self._pacing_reset = True
+
+    def start_ffmpeg_processes(self, frame_number, restart=False):
+        """Positions the persistent decoder at `frame_number`, respawning only when required."""
         try:
-            creation_flags = sp.CREATE_NO_WINDOW if hasattr(sp, 'CREATE_NO_WINDOW') else 0
-            self.ffmpeg_process1 = sp.Popen(command1, stdout=sp.PIPE, stderr=sp.DEVNULL, creationflags=creation_flags)
-            self.ffmpeg_process2 = sp.Popen(command2, stdout=sp.PIPE, stderr=sp.DEVNULL, creationflags=creation_flags)
+            with self.decoder_lock:
+                if restart: self.stop_ffmpeg_processes()
+                self._seek_decoders(frame_number)
         except Exception as e:
             messagebox.showerror("FFmpeg Error", f"Failed to start FFmpeg processes: {e}")
             with self.playback_lock: self.is_playing = False
 
+    def _kill_process(self, proc):
+        if proc and proc.poll() is None:
+            try:
+                proc.kill()
+            except Exception as e:
+                print(f"Error killing FFmpeg process: {e}")
+
     def stop_ffmpeg_processes(self):
-        for proc in [self.ffmpeg_process1, self.ffmpeg_process2]:
-            if proc and proc.poll() is None: 
-                try:
-                    proc.kill()
-                except Exception as e:
-                    print(f"Error killing FFmpeg process: {e}")
-        self.ffmpeg_process1, self.ffmpeg_process2 = None, None
+        self._kill_process(self.ffmpeg_process)
+        self.ffmpeg_process, self._decoder_size = None, None
+
+    def _start_playback_thread(self):
+        """Starts a playback loop; any older loop notices the new token and exits."""
+        self._playback_token = token = object()
+        threading.Thread(target=self.video_playback_loop, args=(token,), daemon=True).start()
 
     def toggle_play_pause(self):
         if self.play_pause_btn['state'] == tk.DISABLED: return
@@ -299,42 +625,66 @@ class VideoComparer(tk.Tk):
         if self.is_playing:
             self.play_pause_btn.config(text="❚❚ Pause")
             self.update_status_bar("Playing")
-            self.start_ffmpeg_processes(self.current_frame_num)
-            threading.Thread(target=self.video_playback_loop, daemon=True).start()
+            self.start_ffmpeg_processes(self.current_frame_num + 1)
+            self._start_playback_thread()
         else:
             self.play_pause_btn.config(text="▶ Play")
             self.update_status_bar("Paused")
-            self.stop_ffmpeg_processes()
 
-    def video_playback_loop(self):
+    def video_playback_loop(self, token):
         consecutive_errors = 0
         max_errors = 10
+        shape = (self.display_height, self.display_width, 3)
+        frame_period = 1.0 / self.video_fps
+        # Frames are due on a fixed monotonic schedule so slow iterations don't accumulate drift
+        deadline = time.monotonic()
+        dropped = False
         while True:
-            frame_size = self.display_width * self.display_height * 3
             with self.playback_lock:
-                if not self.is_playing: break
-            
-            if self.ffmpeg_process1.poll() is not None or self.ffmpeg_process2.poll() is not None:
-                self.handle_playback_end("Video stream ended")
-                break
+                if not self.is_playing or token is not self._playback_token: break
 
             if self.current_frame_num >= self.total_frames - 1:
                 self.handle_playback_end("Finished")
                 break
-            raw_frame1 = self.ffmpeg_process1.stdout.read(frame_size)
-            raw_frame2 = self.ffmpeg_process2.stdout.read(frame_size)
-            if not raw_frame1 or not raw_frame2 or len(raw_frame1) != frame_size or len(raw_frame2) != frame_size:
+
+            with self.decoder_lock:
+                # A resize reallocates the buffers; the restarted loop takes over
+                resized = (self.display_height, self.display_width, 3) != shape
+                proc = self.ffmpeg_process
+                stream_ended = not proc or proc.poll() is not None
+                if not stream_ended and not resized:
+                    frame_number = self.decoder_pos1
+                    frame_ok = self._decode_next_pair()
+                    pacing_reset, self._pacing_reset = self._pacing_reset, False
+            if resized: break
+            if stream_ended:
+                self.handle_playback_end("Video stream ended")
+                break
+            if not frame_ok:
                 consecutive_errors += 1
                 if consecutive_errors >= max_errors:
                     self.handle_playback_end("Error: Playback stopped")
                     break
                 continue
             consecutive_errors = 0
-            self.current_frame_num += 1
-            if self.duration_known: self.after(0, self.seek_bar.set, self.current_frame_num)
-            self.after(0, self.update_frame_display, raw_frame1, raw_frame2)
+            self.current_frame_num = frame_number
+            # After a seek or respawn the first frame is due now
+            if pacing_reset: deadline = time.monotonic() - frame_period
+            deadline += frame_period
+            slack = deadline - time.monotonic()
+            if slack > 0:
+                time.sleep(slack)
+            elif slack < -2 * frame_period and not dropped:
+                # Running behind: the frame was decoded to keep the pipe in step, but isn't shown.
+                # Restart the schedule from now, and never drop twice in a row, so a decoder slower
+                # than real time lowers the frame rate instead of freezing the picture.
+                dropped = True
+                deadline = time.monotonic()
+                continue
+            dropped = False
+            if self.duration_known: self.after(0, self._set_seek_bar, self.current_frame_num)
+            self._request_render()
             self.after(0, self.update_status_bar, "Playing")
-            time.sleep(1.0 / self.video_fps)
 
     def handle_playback_end(self, message):
         with self.playback_lock: self.is_playing = False
@@ -345,60 +695,153 @@ class VideoComparer(tk.Tk):
         self.after(0, lambda: self.play_pause_btn.config(text="▶ Play"))
         self.after(0, self.update_status_bar, message)
 
-    def update_frame_display(self, raw_frame1, raw_frame2):
-        """Converts raw frame data to an image and displays it with various comparison modes."""
+    def _request_render(self):
+        """Asks the render worker to composite the front frame pair. Never blocks."""
+        try:
+            self.frame_q.put_nowait(None)
+        except queue.Full:
+            pass  # A pending request already picks up the newest front pair
+
+    def _render_worker(self):
+        """Composites frames off the Tk thread and hands finished images to `_present_frame`."""
+        warm_up_kernels()
+        while True:
+            self.frame_q.get()
+            with self.buffer_lock:
+                frame1, frame2 = self._frame1, self._frame2
+                if frame1 is None: continue
+                self._composing = frame1
+                out = self._composites[self._composite_index]
+                self._composite_index = (self._composite_index + 1) % len(self._composites)
+            try:
+                image = self.update_frame_display(frame1, frame2, out)
+            except Exception as e:
+                print(f"Error rendering frame: {e}")
+                continue
+            finally:
+                with self.buffer_lock: self._composing = None
+            # Blocks while Tk is still showing the previous image, which keeps `out` from being reused too early
+            self.render_q.put(image)
+            self.after(0, self._present_frame)
+
+    def _present_frame(self):
+        """Shows the next composited image. Runs on the Tk thread."""
+        try:
+            image = self.render_q.get_nowait()
+        except queue.Empty:
+            return
+        if image.size != (self.display_width, self.display_height): return  # Rendered before a resize
         if self.video_label.cget("text"): self.video_label.config(text="")
-        
-        frame1_bgr = np.frombuffer(raw_frame1, dtype='uint8').reshape((self.display_height, self.display_width, 3))
-        frame2_bgr = np.frombuffer(raw_frame2, dtype='uint8').reshape((self.display_height, self.display_width, 3))
-        
-        mode = self.comparison_mode_var.get()
-        
+        self._photo.paste(image)
+
+    def update_frame_display(self, frame1_rgb, frame2_rgb, out):
+        """Composites two decoded frames into `out` for the current mode and returns it as an RGB image."""
+        height, width = out.shape[:2]
+        split_pos = min(self.split_pos, width)
+        combined_frame = out
+        mode = self.comparison_mode
+
         if mode == 'side_by_side':
-            combined_frame = frame1_bgr.copy()
-            combined_frame[:, self.split_pos:] = frame2_bgr[:, self.split_pos:]
-            cv2.line(combined_frame, (self.split_pos, 0), (self.split_pos, self.display_height), (0, 255, 0), 2)
+            if side_by_side_rgb is not None:
+                side_by_side_rgb(frame1_rgb, frame2_rgb, combined_frame, split_pos)
+            else:
+                np.copyto(combined_frame[:, :split_pos], frame1_rgb[:, :split_pos])
+                np.copyto(combined_frame[:, split_pos:], frame2_rgb[:, split_pos:])
+                combined_frame[:, split_pos:split_pos + 2] = (0, 255, 0)
         elif mode == 'overlay':
-            alpha = self.split_pos / self.display_width
-            combined_frame = cv2.addWeighted(frame1_bgr, 1 - alpha, frame2_bgr, alpha, 0)
+            alpha = split_pos / width
+            if blend_rgb is not None:
+                blend_rgb(frame1_rgb, frame2_rgb, combined_frame, round(alpha * 256))
+            else:
+                cv2.addWeighted(frame1_rgb, 1 - alpha, frame2_rgb, alpha, 0, dst=combined_frame)
         elif mode == 'difference':
-            diff = cv2.absdiff(frame1_bgr, frame2_bgr)
-            combined_frame = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-            combined_frame = cv2.cvtColor(combined_frame, cv2.COLOR_GRAY2BGR)
+            if diff_gray_rgb is not None:
+                diff_gray_rgb(frame1_rgb, frame2_rgb, combined_frame)
+            else:
+                cv2.absdiff(frame1_rgb, frame2_rgb, dst=combined_frame)
+                cv2.transform(combined_frame, LUMA_MATRIX, dst=combined_frame)
         elif mode == 'toggle':
-            combined_frame = frame1_bgr if self.split_pos < self.display_width / 2 else frame2_bgr
-        
+            # Copied so the labels drawn below never land on the cached source frame
+            np.copyto(combined_frame, frame1_rgb if split_pos < width / 2 else frame2_rgb)
+
         self._add_video_labels(combined_frame)
-        img = cv2.cvtColor(combined_frame, cv2.COLOR_BGR2RGB)
-        photo = ImageTk.PhotoImage(image=Image.fromarray(img))
-        self.video_label.config(image=photo)
-        self.video_label.image = photo
+        # ffmpeg already delivers rgb24, so PIL can wrap the buffer without a conversion pass
+        return Image.frombuffer('RGB', (width, height), combined_frame, 'raw', 'RGB', 0, 1)
+
+    def _render_label(self, text):
+        """
+        Rasterizes a filename label with its drop shadow once. Returns (top, colour, inverse
+        alpha, text width): the colour patch is premultiplied, the inverse alpha is in 1/256ths.
+        """
+        if not text: return None
+        (text_width, text_height), baseline = cv2.getTextSize(text, LABEL_FONT, LABEL_SCALE, LABEL_THICKNESS + 1)
+        top = max(0, LABEL_Y - text_height - 2)
+        color = np.zeros((LABEL_Y + baseline + 2 - top, text_width + 3, 3), np.uint8)
+        alpha = np.zeros(color.shape[:2], np.uint8)
+        for canvas, shadow, fill in ((color, (0, 0, 0), (255, 255, 255)), (alpha, 255, 255)):
+            cv2.putText(canvas, text, (1, LABEL_Y + 1 - top), LABEL_FONT, LABEL_SCALE, shadow, LABEL_THICKNESS + 1, cv2.LINE_AA)
+            cv2.putText(canvas, text, (0, LABEL_Y - top), LABEL_FONT, LABEL_SCALE, fill, LABEL_THICKNESS, cv2.LINE_AA)
+        inv_alpha = 256 - (alpha.astype(np.uint16) + (alpha >> 7))
+        (text_width, _), _ = cv2.getTextSize(text, LABEL_FONT, LABEL_SCALE, LABEL_THICKNESS)
+        return top, color.astype(np.uint16), inv_alpha[..., None], text_width
+
+    def _blend_label(self, frame, sprite, x):
+        """Composites a pre-rendered label onto `frame` with its left edge at `x`, clipped to the frame."""
+        top, color, inv_alpha, _ = sprite
+        x0, x1 = max(0, x), min(frame.shape[1], x + color.shape[1])
+        y1 = min(frame.shape[0], top + color.shape[0])
+        if x0 >= x1 or top >= y1: return
+        roi = frame[top:y1, x0:x1]
+        cols = slice(x0 - x, x1 - x)
+        blended = (roi * inv_alpha[:y1 - top, cols]) >> 8
+        blended += color[:y1 - top, cols]
+        np.minimum(blended, 255, out=blended)
+        roi[:] = blended
 
     def _add_video_labels(self, frame):
-        """Draws video filenames onto the frame."""
-        font, scale, color, thickness = cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 1
-        shadow = (0, 0, 0)
-        cv2.putText(frame, self.video_name1, (11, 31), font, scale, shadow, thickness + 1, cv2.LINE_AA)
-        cv2.putText(frame, self.video_name1, (10, 30), font, scale, color, thickness, cv2.LINE_AA)
-        (w, _), _ = cv2.getTextSize(self.video_name2, font, scale, thickness)
-        x = self.display_width - w - 10
-        cv2.putText(frame, self.video_name2, (x + 1, 31), font, scale, shadow, thickness + 1, cv2.LINE_AA)
-        cv2.putText(frame, self.video_name2, (x, 30), font, scale, color, thickness, cv2.LINE_AA)
+        """Draws video filenames onto the frame from the sprites rendered at load time."""
+        sprite1, sprite2 = self._label_sprites
+        if sprite1: self._blend_label(frame, sprite1, 10)
+        if sprite2: self._blend_label(frame, sprite2, self._label2_x)
 
     def _on_video_drag(self, event):
         """Handles dragging on the video to set the split position."""
         if not self.video_path1: return
         self.split_pos = max(0, min(self.display_width, event.x))
-        if not self.is_playing: self.display_single_frame(self.current_frame_num)
+        # Motion events arrive far faster than the screen refreshes; repaint at most once per ~16 ms,
+        # picking up whatever split position is current when the pending repaint runs
+        if self._drag_job is None:
+            self._drag_job = self.after(16, self._drag_repaint)
+
+    def _drag_repaint(self):
+        """Redraws the frame with the latest split position from a drag."""
+        self._drag_job = None
+        self._recomposite()
 
     def _on_video_click(self, event):
         """Handles clicking on the video to set the split position."""
         if not self.video_path1: return
         self.split_pos = max(0, min(self.display_width, event.x))
-        if not self.is_playing: self.display_single_frame(self.current_frame_num)
+        self._recomposite()
+
+    def _recomposite(self):
+        """Redraws the frame pair on screen after a split or mode change, without touching the decoders."""
+        if not self.video_path1 or not self.video_path2: return
+        if self._frame_key is not None:
+            self._request_render()
+        elif not self.is_playing:
+            self.display_single_frame(self.current_frame_num)
+
+    def _set_seek_bar(self, frame_number):
+        """Moves the seek bar without it firing a seek back into the decoders."""
+        self._seek_bar_busy = True
+        try:
+            self.seek_bar.set(frame_number)
+        finally:
+            self._seek_bar_busy = False
 
     def seek_video(self, value):
-        if self.seek_bar['state'] == tk.DISABLED: return
+        if self.seek_bar['state'] == tk.DISABLED or self._seek_bar_busy: return
         self.current_frame_num = int(float(value))
         if self.is_playing: self.start_ffmpeg_processes(self.current_frame_num)
         else: self.display_single_frame(self.current_frame_num)
@@ -410,7 +853,7 @@ class VideoComparer(tk.Tk):
         new_frame = self.current_frame_num + direction
         if 0 <= new_frame < self.total_frames:
             self.current_frame_num = new_frame
-            if self.duration_known: self.seek_bar.set(self.current_frame_num)
+            if self.duration_known: self._set_seek_bar(self.current_frame_num)
             self.display_single_frame(self.current_frame_num)
             self.update_status_bar("Stepped")
 
@@ -419,34 +862,35 @@ class VideoComparer(tk.Tk):
         if self.duration_known and not (0 <= frame_number < self.total_frames):
             return
 
-        time_offset1 = frame_number / self.fps1
-        time_offset2 = (frame_number + self.video2_offset) / self.fps2
-        frame_size = self.display_width * self.display_height * 3
-        vf_filter = f"scale={self.display_width}:{self.display_height}"
-        common_args = ['-vf', vf_filter, '-f', 'image2pipe', '-vcodec', 'rawvideo', '-pix_fmt', 'bgr24', '-vframes', '1', '-']
-        command1 = [self.ffmpeg_path, '-ss', str(time_offset1), '-i', self.video_path1, *common_args]
-        command2 = [self.ffmpeg_path, '-ss', str(time_offset2), '-i', self.video_path2, *common_args]
+        # The decoders have already moved past the frame on screen, so serve repeats from the front pair
+        key = (max(0, frame_number), max(0, frame_number + self.video2_offset), self.display_width, self.display_height)
+        if self._frame_key == key:
+            self._request_render()
+            return
+
         try:
-            raw_frame1 = sp.check_output(command1, stderr=sp.DEVNULL)
-            raw_frame2 = sp.check_output(command2, stderr=sp.DEVNULL)
-            if len(raw_frame1) == frame_size and len(raw_frame2) == frame_size:
-                 self.update_frame_display(raw_frame1, raw_frame2)
-        except sp.CalledProcessError as e:
+            with self.decoder_lock:
+                self._seek_decoders(frame_number)
+                frame_ok = self._decode_next_pair()
+        except OSError as e:
             print(f"FFmpeg error fetching single frame: {e}")
             self.update_status_bar(f"Error seeking to frame {frame_number}")
+            return
+        if frame_ok:
+            self._request_render()
 
     def _on_comparison_mode_change(self):
         """Refreshes the frame when the comparison mode changes."""
-        if not self.is_playing and self.video_path1 and self.video_path2:
-            self.display_single_frame(self.current_frame_num)
+        self.comparison_mode = self.comparison_mode_var.get()
+        self._recomposite()
 
     def save_snapshot(self):
         """Saves the current displayed frame as an image."""
-        if self.snapshot_btn['state'] == tk.DISABLED or not hasattr(self.video_label, 'image'): return
+        if self.snapshot_btn['state'] == tk.DISABLED or self._photo is None: return
         file_path = filedialog.asksaveasfilename(parent=self, title="Save Snapshot", defaultextension=".png", filetypes=(("PNG files", "*.png"), ("JPEG files", "*.jpg")))
         if not file_path: return
         try:
-            pil_image = ImageTk.getimage(self.video_label.image)
+            pil_image = ImageTk.getimage(self._photo)
             pil_image.save(file_path)
             self.update_status_bar(f"Snapshot saved to {file_path}")
         except Exception as e:
@@ -464,13 +908,15 @@ class VideoComparer(tk.Tk):
         if not self.video_path1: return
         self.video2_offset += amount
         self.offset_var.set(str(self.video2_offset))
-        if not self.is_playing: self.display_single_frame(self.current_frame_num)
-    
+        if self.is_playing: self.start_ffmpeg_processes(self.current_frame_num + 1)
+        else: self.display_single_frame(self.current_frame_num)
+
     def _validate_offset_input(self, *args):
         if not self.video_path1: return
         try:
             self.video2_offset = int(self.offset_var.get())
-            if not self.is_playing: self.display_single_frame(self.current_frame_num)
+            if self.is_playing: self.start_ffmpeg_processes(self.current_frame_num + 1)
+            else: self.display_single_frame(self.current_frame_num)
         except (ValueError, TypeError): pass
 
     def toggle_fullscreen(self, event=None):
@@ -534,15 +980,20 @@ class VideoComparer(tk.Tk):
                     self.is_playing = False
             
             self.after(50, lambda: self._restart_after_resize(was_playing))
+        sprite2 = self._label_sprites[1]
+        self._label2_x = self.display_width - sprite2[3] - 10 if sprite2 else 0
+        self._allocate_frame_buffers()
 
     def _restart_after_resize(self, was_playing):
         """Safely restarts playback after a resize operation."""
         if was_playing:
             with self.playback_lock:
                 self.is_playing = True
-            self.start_ffmpeg_processes(self.current_frame_num)
-            threading.Thread(target=self.video_playback_loop, daemon=True).start()
+            # The running decoders still scale to the old size, so they must be respawned
+            self.start_ffmpeg_processes(self.current_frame_num + 1, restart=True)
+            self._start_playback_thread()
         else:
+            with self.decoder_lock: self.stop_ffmpeg_processes()
             self.display_single_frame(self.current_frame_num)
 
 